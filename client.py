@@ -1,9 +1,60 @@
 import pygame
 import socket
-import pickle
+import struct
+import threading
+import queue
 import time
 import math
 import os
+from functools import lru_cache
+from heapq import nlargest
+from operator import itemgetter
+
+import msgpack
+
+# Each ball crosses the wire as a fixed 11-byte record: uint32 id, int16 x,
+# int16 y, rgb. Ids let delta updates reference individual balls.
+_BALL_STRUCT = struct.Struct("<IhhBBB")
+
+# Move commands are a b"M" tag plus two fixed-point (1/256 px) coordinates;
+# uint16 would overflow at 256 subpixels across an 850px world, hence uint32.
+_MOVE_STRUCT = struct.Struct("<II")
+
+def _unpack_balls(blob):
+    return {bid: (x, y, (r, g, b))
+            for bid, x, y, r, g, b in _BALL_STRUCT.iter_unpack(blob)}
+
+def _recv_exact(sock, n):
+    """Reads exactly n bytes, or None if the connection closed."""
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
+
+def _send_msg(sock, payload):
+    """Sends a length-prefixed message so frames survive TCP segmentation."""
+    sock.sendall(struct.pack("<I", len(payload)) + payload)
+
+def _recv_msg(sock):
+    header = _recv_exact(sock, 4)
+    if header is None:
+        return None
+    (length,) = struct.unpack("<I", header)
+    return _recv_exact(sock, length)
+
+@lru_cache(maxsize=4096)
+def _render(font, text, color):
+    """Renders text through an LRU cache so repeated strings (titles, names,
+    stable scores) reuse the same Surface instead of re-rasterizing every frame."""
+    return font.render(text, True, color)
+
+@lru_cache(maxsize=4096)
+def _size(font, text):
+    """Cached font.size lookup; text measurement is a C roundtrip worth memoizing."""
+    return font.size(text)
 
 class UIManager:
     """Manages all UI elements, with robust text wrapping."""
@@ -30,6 +81,12 @@ class UIManager:
         }
         
         self.chat_history_surfaces = []
+        self._wrapped_msgs = []  # copy of the history we last wrapped
+
+        # Panel sizes are fixed, so bake each one once and reuse the surface.
+        self._panel_cache = {}
+        for size in ((200, 170), (350, 210), (150, 150)):  # leaderboard, chat, minimap
+            self._create_panel(pygame.Rect((0, 0), size))
 
     def _wrap_text(self, text, font, max_width):
         """Wraps text, breaking both spaces and long words."""
@@ -39,22 +96,27 @@ class UIManager:
 
         for word in words:
             # Handle words that are longer than the line itself
-            if font.size(word)[0] > max_width:
+            if _size(font, word)[0] > max_width:
                 if current_line: # Finalize the line before the long word
                     lines.append(current_line.strip())
-                
-                # Break the long word character by character
+
+                # Break the long word using per-glyph advances from a single
+                # metrics() call, instead of a font.size roundtrip per character.
+                advances = [m[4] if m else 0 for m in font.metrics(word)]
                 long_word_buffer = ""
-                for char in word:
-                    if font.size(long_word_buffer + char)[0] < max_width:
+                running_width = 0
+                for char, advance in zip(word, advances):
+                    if running_width + advance < max_width:
                         long_word_buffer += char
+                        running_width += advance
                     else:
                         lines.append(long_word_buffer)
                         long_word_buffer = char
+                        running_width = advance
                 current_line = long_word_buffer + " " # The remainder becomes the new line start
 
-            # Normal word wrapping
-            elif font.size(current_line + word)[0] < max_width:
+            # Normal word wrapping (measured per piece so the cache can hit)
+            elif _size(font, current_line)[0] + _size(font, word)[0] < max_width:
                 current_line += word + " "
             else:
                 lines.append(current_line.strip())
@@ -63,53 +125,86 @@ class UIManager:
         if current_line.strip():
             lines.append(current_line.strip())
 
-        return [font.render(line, True, self.colors['text']) for line in lines if line]
+        return [_render(font, line, self.colors['text']) for line in lines if line]
 
     def _create_panel(self, rect):
-        """Creates a styled, rounded panel surface."""
-        panel = pygame.Surface(rect.size, pygame.SRCALPHA)
-        pygame.draw.rect(panel, self.colors['panel_bg'], panel.get_rect(), border_radius=12)
-        pygame.draw.rect(panel, (*self.colors['accent'], 180), panel.get_rect(), 2, border_radius=12)
+        """Returns a styled, rounded panel surface, cached by size."""
+        panel = self._panel_cache.get(rect.size)
+        if panel is None:
+            panel = pygame.Surface(rect.size, pygame.SRCALPHA)
+            pygame.draw.rect(panel, self.colors['panel_bg'], panel.get_rect(), border_radius=12)
+            pygame.draw.rect(panel, (*self.colors['accent'], 180), panel.get_rect(), 2, border_radius=12)
+            panel = panel.convert_alpha()  # fast-blit format for per-frame reuse
+            self._panel_cache[rect.size] = panel
         return panel
 
     def draw_start_menu(self, win, username):
         win.fill(self.colors['bg_dark'])
-        title_text = self.font_lg.render("AGAR.IO CLONE", True, self.colors['text'])
+        title_text = _render(self.font_lg, "AGAR.IO CLONE", self.colors['text'])
         win.blit(title_text, (self.width / 2 - title_text.get_width() / 2, 200))
         input_box = pygame.Rect(self.width / 2 - 175, 320, 350, 50)
         pygame.draw.rect(win, (40, 45, 55), input_box, border_radius=8)
         pygame.draw.rect(win, self.colors['accent'], input_box, 2, border_radius=8)
-        input_text = self.font_md.render(username, True, self.colors['text'])
+        input_text = _render(self.font_md, username, self.colors['text'])
         win.blit(input_text, (input_box.x + 15, input_box.y + 10))
-        prompt_text = self.font_sm.render("Enter Your Name and Press ENTER", True, self.colors['text_muted'])
+        prompt_text = _render(self.font_sm, "Enter Your Name and Press ENTER", self.colors['text_muted'])
         win.blit(prompt_text, (self.width / 2 - prompt_text.get_width() / 2, 390))
         pygame.display.update()
 
     def update_chat_history(self, msg_history):
-        self.chat_history_surfaces = []
-        chat_panel_width = 350 - 30 
-        for msg in msg_history:
+        """Wraps only the messages that arrived since the last call.
+
+        The server caps its history at 20 and drops the oldest entry once
+        full, so line the new history up against the tail of what was wrapped
+        last time to find where the genuinely new messages start.
+        """
+        prev = self._wrapped_msgs
+        new_count = len(msg_history)
+        for n in range(len(msg_history) + 1):
+            known = len(msg_history) - n
+            if known <= len(prev) and msg_history[:known] == prev[len(prev) - known:]:
+                new_count = n
+                break
+
+        chat_panel_width = 350 - 30
+        for msg in msg_history[len(msg_history) - new_count:]:
             wrapped_surfaces = self._wrap_text(msg, self.font_sm, chat_panel_width)
             self.chat_history_surfaces.extend(wrapped_surfaces)
+        self._wrapped_msgs = list(msg_history)
+
+        # Keep the surface list bounded; only the last few lines are drawn.
+        if len(self.chat_history_surfaces) > 200:
+            del self.chat_history_surfaces[:len(self.chat_history_surfaces) - 200]
+
+    def append_chat_message(self, msg):
+        """Wraps a single new message arriving through a delta update."""
+        chat_panel_width = 350 - 30
+        self.chat_history_surfaces.extend(self._wrap_text(msg, self.font_sm, chat_panel_width))
+        self._wrapped_msgs.append(msg)
+        if len(self._wrapped_msgs) > 20:  # mirror the server's history cap
+            self._wrapped_msgs.pop(0)
+        if len(self.chat_history_surfaces) > 200:
+            del self.chat_history_surfaces[:len(self.chat_history_surfaces) - 200]
 
     def draw_hud(self, win, players, player_id, is_chatting, chat_input, fps):
         # Leaderboard
         panel_rect = pygame.Rect(self.width - 210, 10, 200, 170)
         win.blit(self._create_panel(panel_rect), panel_rect.topleft)
-        title = self.font_md.render("LEADERBOARD", True, self.colors['text'])
+        title = _render(self.font_md, "LEADERBOARD", self.colors['text'])
         title_x = panel_rect.x + (panel_rect.width - title.get_width()) / 2
         win.blit(title, (title_x, panel_rect.y + 10))
-        sorted_players = sorted(players.values(), key=lambda p: p['score'], reverse=True)[:5]
+        # Top 5 via a bounded heap — O(N log 5) instead of a full sort.
+        sorted_players = nlargest(5, players.values(), key=itemgetter('score'))
         for i, p in enumerate(sorted_players):
-            name = self.font_sm.render(f"{i+1}. {p['name']}", True, self.colors['text_muted'])
-            score = self.font_sm.render(str(int(p['score'])), True, self.colors['text'])
+            name = _render(self.font_sm, f"{i+1}. {p['name']}", self.colors['text_muted'])
+            score = _render(self.font_sm, str(int(p['score'])), self.colors['text'])
             win.blit(name, (panel_rect.x + 15, panel_rect.y + 55 + i * 22))
             win.blit(score, (panel_rect.right - score.get_width() - 15, panel_rect.y + 55 + i * 22))
 
         # Chat
         chat_rect = pygame.Rect(10, self.height - 220, 350, 210)
         win.blit(self._create_panel(chat_rect), chat_rect.topleft)
-        chat_title = self.font_md.render("CHAT", True, self.colors['text'])
+        chat_title = _render(self.font_md, "CHAT", self.colors['text'])
         chat_title_x = chat_rect.x + (chat_rect.width - chat_title.get_width()) / 2
         win.blit(chat_title, (chat_title_x, chat_rect.y + 10))
         for i, surface in enumerate(self.chat_history_surfaces[-7:]):
@@ -118,21 +213,24 @@ class UIManager:
             input_rect = pygame.Rect(chat_rect.x, chat_rect.bottom - 35, chat_rect.width, 30)
             pygame.draw.rect(win, (40, 45, 55), input_rect, border_radius=8)
             prompt = f"> {chat_input}"
-            if time.time() % 1 > 0.5: prompt += "_"
-            input_surf = self.font_sm.render(prompt, True, self.colors['text'])
+            # 2 Hz integer blink; both cursor variants are _render cache hits.
+            if int(time.time() * 2) & 1: prompt += "_"
+            input_surf = _render(self.font_sm, prompt, self.colors['text'])
             win.blit(input_surf, (input_rect.x + 10, input_rect.y + 5))
             
         # Player Stats & FPS
         player = players.get(player_id)
         stats_text = f"Mass: {int(player['score']) if player else 0}"
-        fps_text = f"FPS: {fps:.0f}"
-        stats_surf = self.font_md.render(stats_text, True, self.colors['text'])
-        fps_surf = self.font_md.render(fps_text, True, self.colors['text_muted'])
+        fps_text = f"FPS: {int(fps)}"  # Quantize so only ~60 distinct strings ever hit the cache
+        stats_surf = _render(self.font_md, stats_text, self.colors['text'])
+        fps_surf = _render(self.font_md, fps_text, self.colors['text_muted'])
         stats_panel_rect = pygame.Rect(10, 10, max(stats_surf.get_width(), fps_surf.get_width()) + 30, 70)
         win.blit(self._create_panel(stats_panel_rect), stats_panel_rect.topleft)
         win.blit(stats_surf, (stats_panel_rect.x + 15, stats_panel_rect.y + 10))
         win.blit(fps_surf, (stats_panel_rect.x + 15, stats_panel_rect.y + 38))
-        
+
+        return [panel_rect, chat_rect, stats_panel_rect]
+
     def draw_minimap(self, win, players, player_id, world_size):
         map_size = 150
         map_rect = pygame.Rect(self.width - map_size - 10, self.height - map_size - 10, map_size, map_size)
@@ -143,12 +241,14 @@ class UIManager:
             map_y = int(p['y'] / H * map_size)
             color = self.colors['accent'] if p_id == player_id else p['color']
             pygame.draw.circle(win, color, (map_rect.x + map_x, map_rect.y + map_y), 3)
+        return map_rect
 
 class GameClient:
     WIDTH, HEIGHT = 1280, 720
     SERVER_IP = "127.0.0.1"
     PORT = 5555
     START_RADIUS = 7
+    NET_RATE = 30  # server round-trips per second; rendering runs at 60
 
     def __init__(self):
         pygame.init()
@@ -159,18 +259,139 @@ class GameClient:
         self.ui = UIManager(self.WIDTH, self.HEIGHT)
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.username, self.player_id = "", -1
-        self.players, self.balls = {}, []
+        self.players, self.balls = {}, {}  # balls: ball id -> (x, y, color)
         self.chat_input, self.is_chatting = "", False
         self.world_size = (850, 720) # Match server's W, H
 
-    def send(self, data):
+        # Networking runs on its own thread at NET_RATE so a server round-trip
+        # never blocks rendering; outgoing chat commands queue up here.
+        self._outgoing = queue.SimpleQueue()
+        self.connected = False
+
+        # Dirty-rect bookkeeping: where things were drawn last frame, so a
+        # static-camera frame only pushes the regions that actually changed.
+        self._prev_cam = None
+        self._prev_rects = {}
+        self._balls_dirty = True
+
+        # Circle surfaces cached by (color, radius); player radii only grow in
+        # 0.5 steps, so the integer-radius keys hit almost every frame.
+        self._circle_cache = {}
+
+        # All balls live on one world-sized layer that is repainted only when
+        # the ball set changes; a frame then needs a single blit of the layer
+        # instead of a couple hundred sprite blits.
+        self._ball_layer = pygame.Surface(self.world_size, pygame.SRCALPHA).convert_alpha()
+
+    def send(self, command):
+        """Sends one raw command frame and returns the decoded server reply."""
         try:
-            self.client_socket.send(pickle.dumps(data))
-            response = self.client_socket.recv(4096 * 2)
-            return pickle.loads(response)
-        except (socket.error, EOFError, pickle.UnpicklingError):
+            _send_msg(self.client_socket, command)
+            response = _recv_msg(self.client_socket)
+            if response is None:
+                return None
+            return msgpack.unpackb(response, raw=False, strict_map_key=False)
+        except (socket.error, EOFError, msgpack.UnpackException):
             return None
 
+    def _circle_sprite(self, color, radius):
+        """Returns a pre-rendered circle surface for (color, radius)."""
+        key = (color, radius)
+        sprite = self._circle_cache.get(key)
+        if sprite is None:
+            size = radius * 2 + 1
+            sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, color, (radius, radius), radius)
+            sprite = sprite.convert_alpha()
+            self._circle_cache[key] = sprite
+        return sprite
+
+    def _repaint_ball_layer(self):
+        """Re-stamps every ball sprite onto the persistent ball layer."""
+        self._ball_layer.fill((0, 0, 0, 0))
+        for bx, by, b_color in self.balls.values():
+            self._ball_layer.blit(self._circle_sprite(b_color, 5), (bx - 5, by - 5))
+
+    def _apply_response(self, response):
+        """Applies a server reply — a full snapshot or a delta — to local state."""
+        kind = response[0]
+        if kind == "full":
+            _, balls_blob, players, _, msg_history = response
+            self.balls = _unpack_balls(balls_blob)
+            for player in players.values():
+                player["color"] = tuple(player["color"])  # hashable sprite key
+            self.players = players
+            self.ui.update_chat_history(msg_history)
+            self._balls_dirty = True
+            return
+
+        # The render thread iterates these dicts, so never resize them in
+        # place: apply the delta to shallow copies and publish each with a
+        # single reference assignment, like the full-snapshot path above.
+        _, events, positions, _ = response
+        balls = dict(self.balls)
+        players = dict(self.players)
+        balls_changed = False
+        for event in events:
+            tag = event[0]
+            if tag == "ball_add":
+                _, bid, x, y, color = event
+                balls[bid] = (x, y, tuple(color))
+                balls_changed = True
+            elif tag == "ball_rem":
+                balls.pop(event[1], None)
+                balls_changed = True
+            elif tag == "player_add":
+                _, pid, name, color = event
+                if pid not in players:
+                    players[pid] = {"x": 0, "y": 0, "color": tuple(color),
+                                    "score": 0, "name": name}
+            elif tag == "player_rem":
+                players.pop(event[1], None)
+            elif tag == "msg":
+                self.ui.append_chat_message(event[1])
+        for pid, (x, y, score) in positions.items():
+            player = players.get(pid)
+            if not player:
+                continue
+            if pid == self.player_id:
+                # The echo lags local prediction by up to a server tick; only
+                # snap to it on big jumps (respawns after being eaten).
+                if (x - player["x"]) ** 2 + (y - player["y"]) ** 2 > 50 ** 2:
+                    player["x"], player["y"] = x, y
+                player["score"] = score
+            else:
+                player["x"], player["y"], player["score"] = x, y, score
+        self.balls = balls
+        self.players = players
+        if balls_changed:
+            # Flag only after the swap so the draw thread can't repaint the
+            # layer from the old dict and then clear the flag.
+            self._balls_dirty = True
+
+    def _network_loop(self):
+        """Exchanges state with the server at NET_RATE, off the render thread."""
+        interval = 1.0 / self.NET_RATE
+        while self.connected:
+            step_start = time.time()
+            commands = []
+            while True:
+                try:
+                    commands.append(self._outgoing.get_nowait())
+                except queue.Empty:
+                    break
+            current_player = self.players.get(self.player_id)
+            if current_player:
+                commands.append(b"M" + _MOVE_STRUCT.pack(
+                    int(current_player['x'] * 256), int(current_player['y'] * 256)))
+            for command in commands:
+                response = self.send(command)
+                if response is None:
+                    self.connected = False
+                    return
+                self._apply_response(response)
+            time.sleep(max(0.0, interval - (time.time() - step_start)))
+
     def draw_game_world(self):
         self.win.fill(self.ui.colors['bg_dark'])
         current_player = self.players.get(self.player_id)
@@ -179,20 +400,45 @@ class GameClient:
             cam_x = current_player["x"] - self.WIDTH / 2
             cam_y = current_player["y"] - self.HEIGHT / 2
 
-        for ball in self.balls:
-            bx, by, b_color = ball
-            pygame.draw.circle(self.win, b_color, (bx - cam_x, by - cam_y), 5)
+        # Snapshot-and-clear the flag up front: a delta landing later in this
+        # frame re-sets it and is handled next frame instead of being lost.
+        balls_dirty, self._balls_dirty = self._balls_dirty, False
+        if balls_dirty:
+            self._repaint_ball_layer()
+        self.win.blit(self._ball_layer, (-cam_x, -cam_y))
 
-        for p in sorted(self.players.values(), key=lambda item: item['score']):
+        frame_rects = {}
+        for pid, p in sorted(self.players.items(), key=lambda item: item[1]['score']):
             px, py = p["x"] - cam_x, p["y"] - cam_y
             radius = self.START_RADIUS + p["score"]
-            pygame.draw.circle(self.win, p["color"], (px, py), int(radius))
-            name_text = self.font_name.render(p["name"], True, self.ui.colors['text'])
-            self.win.blit(name_text, (px - name_text.get_width()/2, py - name_text.get_height()/2))
-        
-        self.ui.draw_hud(self.win, self.players, self.player_id, self.is_chatting, self.chat_input, self.clock.get_fps())
-        self.ui.draw_minimap(self.win, self.players, self.player_id, self.world_size)
-        pygame.display.update()
+            r = int(radius)
+            self.win.blit(self._circle_sprite(p["color"], r), (px - r, py - r))
+            name_text = _render(self.font_name, p["name"], self.ui.colors['text'])
+            name_pos = (px - name_text.get_width()/2, py - name_text.get_height()/2)
+            self.win.blit(name_text, name_pos)
+            rect = pygame.Rect(int(px - radius), int(py - radius),
+                               int(radius * 2) + 1, int(radius * 2) + 1)
+            frame_rects[f"player:{pid}"] = rect.union(name_text.get_rect(topleft=name_pos))
+
+        hud_rects = self.ui.draw_hud(self.win, self.players, self.player_id, self.is_chatting, self.chat_input, self.clock.get_fps())
+        for i, rect in enumerate(hud_rects):
+            frame_rects[f"hud:{i}"] = rect
+        frame_rects["minimap"] = self.ui.draw_minimap(self.win, self.players, self.player_id, self.world_size)
+
+        # The backbuffer is always fully redrawn; the flip is what we limit.
+        # When the camera scrolled or the ball set changed, everything on
+        # screen moved, so do a full update. Otherwise push only the regions
+        # occupied this frame or last frame (entities, HUD, minimap).
+        cam = (round(cam_x), round(cam_y))
+        if cam != self._prev_cam or balls_dirty:
+            pygame.display.update()
+        else:
+            dirty = list(frame_rects.values())
+            dirty.extend(rect for key, rect in self._prev_rects.items()
+                         if frame_rects.get(key) != rect)
+            pygame.display.update(dirty)
+        self._prev_cam = cam
+        self._prev_rects = frame_rects
 
     def run(self):
         menu_running = True
@@ -207,19 +453,25 @@ class GameClient:
             
         try:
             self.client_socket.connect((self.SERVER_IP, self.PORT))
-            self.client_socket.send(self.username.encode("utf-8"))
-            self.player_id = pickle.loads(self.client_socket.recv(1024))
+            # Disable Nagle so small per-tick frames go out immediately.
+            self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            _send_msg(self.client_socket, self.username.encode("utf-8"))
+            # The id arrives as a bare uint32, not a framed msgpack message.
+            self.player_id = struct.unpack("<I", _recv_exact(self.client_socket, 4))[0]
         except socket.error as e:
             print(f"[CONNECTION FAILED] {e}"); pygame.quit(); return
             
-        initial_data = self.send("move 0 0")
+        initial_data = self.send(b"M" + _MOVE_STRUCT.pack(0, 0))
         if not initial_data: pygame.quit(); return
-        
-        self.balls, self.players, _, msg_history = initial_data
-        self.ui.update_chat_history(msg_history)
+        self._apply_response(initial_data)
+
+        self.connected = True
+        net_thread = threading.Thread(target=self._network_loop)
+        net_thread.daemon = True
+        net_thread.start()
 
         game_running = True
-        while game_running:
+        while game_running and self.connected:
             self.clock.tick(60)
 
             for event in pygame.event.get():
@@ -228,7 +480,7 @@ class GameClient:
                     if event.key == pygame.K_RETURN:
                         self.is_chatting = not self.is_chatting
                         if not self.is_chatting and self.chat_input:
-                            self.send(f"msg {self.chat_input}"); self.chat_input = ""
+                            self._outgoing.put(b"C" + self.chat_input.encode("utf-8")); self.chat_input = ""
                     elif self.is_chatting:
                         if event.key == pygame.K_BACKSPACE: self.chat_input = self.chat_input[:-1]
                         else: self.chat_input += event.unicode
@@ -242,25 +494,19 @@ class GameClient:
                 dist = math.hypot(dx, dy)
                 if dist > 1:
                     speed = max(2, 6 - (current_player["score"] / 20))
-                    current_player["x"] += (dx / dist) * speed
-                    current_player["y"] += (dy / dist) * speed
+                    x = current_player["x"] + (dx / dist) * speed
+                    y = current_player["y"] + (dy / dist) * speed
 
-                    # --- NEW: WORLD BOUNDARY CHECK ---
-                    radius = self.START_RADIUS + current_player["score"]
+                    # World boundary clamp on locals: ternaries instead of a
+                    # min/max call pair and repeated dict lookups per axis.
+                    r = self.START_RADIUS + current_player["score"]
                     world_w, world_h = self.world_size
-                    current_player["x"] = max(radius, min(current_player["x"], world_w - radius))
-                    current_player["y"] = max(radius, min(current_player["y"], world_h - radius))
-
-            if current_player:
-                response = self.send(f"move {int(current_player['x'])} {int(current_player['y'])}")
-                if response:
-                    self.balls, self.players, _, msg_history = response
-                    if len(msg_history) > len(self.ui.chat_history_surfaces):
-                        self.ui.update_chat_history(msg_history)
-                else: game_running = False
+                    current_player["x"] = r if x < r else (world_w - r if x > world_w - r else x)
+                    current_player["y"] = r if y < r else (world_h - r if y > world_h - r else y)
 
             self.draw_game_world()
 
+        self.connected = False
         self.client_socket.close()
         pygame.quit()
 
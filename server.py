@@ -1,10 +1,73 @@
 import socket
+import struct
 import threading
-import pickle
+import queue
 import time
 import random
 import math
 
+import msgpack
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the plain NumPy/Python cores still run
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        def wrap(func):
+            return func
+        return wrap
+
+@njit(cache=True)
+def _hit_mask(px, py, radius, bx, by):
+    """Boolean mask of which balls lie within `radius` of the player."""
+    # Compare squared distances; no per-ball sqrt needed.
+    return (bx - px) ** 2 + (by - py) ** 2 <= radius * radius
+
+@njit(cache=True)
+def _is_safe_spot(x, y, px_arr, py_arr, pr_arr):
+    """True if (x, y) is outside every player's eat radius."""
+    for i in range(px_arr.size):
+        dx = px_arr[i] - x
+        dy = py_arr[i] - y
+        if dx * dx + dy * dy <= pr_arr[i] * pr_arr[i]:
+            return False
+    return True
+
+# Each ball crosses the wire as a fixed 11-byte record: uint32 id, int16 x,
+# int16 y, rgb. Ids let later delta updates reference individual balls.
+_BALL_STRUCT = struct.Struct("<IhhBBB")
+
+# Move commands are a b"M" tag plus two fixed-point (1/256 px) coordinates;
+# uint16 would overflow at 256 subpixels across an 850px world, hence uint32.
+_MOVE_STRUCT = struct.Struct("<II")
+
+def _pack_balls(ball_ids, bx, by, bcolor):
+    return b"".join(_BALL_STRUCT.pack(bid, int(x), int(y), *color)
+                    for bid, x, y, color in zip(ball_ids, bx, by, bcolor))
+
+def _recv_exact(sock, n):
+    """Reads exactly n bytes, or None if the connection closed."""
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
+
+def _send_msg(sock, payload):
+    """Sends a length-prefixed message so frames survive TCP segmentation."""
+    sock.sendall(struct.pack("<I", len(payload)) + payload)
+
+def _recv_msg(sock):
+    header = _recv_exact(sock, 4)
+    if header is None:
+        return None
+    (length,) = struct.unpack("<I", header)
+    return _recv_exact(sock, length)
+
 class GameServer:
     """
     Manages the game state, player connections, and all server-side logic.
@@ -12,13 +75,16 @@ class GameServer:
     # --- Constants ---
     HOST = '0.0.0.0'  # Bind to all available network interfaces
     PORT = 5555
-    BUFFER_SIZE = 4096
 
     # --- Game Settings ---
     W, H = 850, 720
     START_RADIUS = 7
     ROUND_TIME = 60 * 5  # 5 minutes
     MASS_LOSS_TIME = 7
+    EVENT_LOG_CAP = 1024  # mutations kept for clients that lag behind
+    GRID_CELL = 64  # spatial-hash cell size, comfortably above a typical eat radius
+    TICK_RATE = 30  # simulation steps per second
+    MAX_SPAWN_TRIES = 10  # rejection-sampling attempts before settling
     COLORS = [
         (255,0,0), (255,128,0), (255,255,0), (128,255,0), (0,255,0),
         (0,255,128), (0,255,255), (0,128,255), (0,0,255), (128,0,255),
@@ -31,18 +97,44 @@ class GameServer:
         
         # --- Game State ---
         self.players = {}
-        self.balls = []
+        # Balls live in parallel arrays (struct-of-arrays) so collision checks
+        # run as single vectorized expressions instead of per-ball Python loops.
+        self.ball_ids = np.empty(0, np.uint32)
+        self.bx = np.empty(0, np.float32)
+        self.by = np.empty(0, np.float32)
+        self.bcolor = np.empty((0, 3), np.uint8)
+        self._next_ball_id = 0
+        # Spatial hash over the ball arrays: (cell x, cell y) -> list of rows.
+        # Collision queries then only look at the cells the player overlaps.
+        self._ball_grid = {}
         self.msg_history = []
+
+        # World mutations since startup, so each client only receives what
+        # changed since its last tick. `event_base` is the sequence number of
+        # events[0]; clients that fall behind it get a fresh full snapshot.
+        self.events = []
+        self.event_base = 0
         self.game_time = "Starting Soon"
         self.start_time = 0
         self.game_started = False
         self.next_mass_loss_tick = 1
         self.player_id_counter = 0
         
-        # --- Threading Safety ---
-        # A lock is crucial to prevent race conditions when multiple threads
-        # access shared data like `self.players` or `self.balls`.
-        self.lock = threading.Lock()
+        # --- Threading Model ---
+        # A single simulation thread owns all game state. Client threads never
+        # touch it directly: they queue inputs here and read the immutable
+        # snapshot tuple the simulation publishes each tick, so no lock is
+        # needed anywhere on the hot path.
+        self._input_q = queue.SimpleQueue()
+        self._balls_blob = b""
+        self._balls_changed = False
+        self._snapshot = (0, (), {}, self.game_time, b"", {}, ())
+
+        # Call the jitted cores once with tiny arrays so the JIT compile cost
+        # is paid at startup rather than on the first real tick.
+        warm = np.zeros(1, np.float32)
+        _hit_mask(0.0, 0.0, 1.0, warm, warm)
+        _is_safe_spot(0.0, 0.0, warm, warm, warm)
 
     def start(self):
         """Binds the server and starts listening for connections."""
@@ -59,9 +151,15 @@ class GameServer:
         self._create_balls(200)
         print("[GAME] World generated. Waiting for players...")
 
+        sim_thread = threading.Thread(target=self._sim_loop)
+        sim_thread.daemon = True
+        sim_thread.start()
+
         # Main loop to accept new connections
         while True:
             client_socket, client_address = self.server_socket.accept()
+            # Disable Nagle so small per-tick frames go out immediately.
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             print(f"[CONNECTION] Connected to: {client_address}")
 
             if not self.game_started:
@@ -78,36 +176,64 @@ class GameServer:
             thread.daemon = True # Allows main program to exit even if threads are running
             thread.start()
 
+    def _player_arrays(self):
+        """Snapshots player positions and radii into arrays for vector math."""
+        n = len(self.players)
+        px = np.fromiter((p["x"] for p in self.players.values()), np.float32, count=n)
+        py = np.fromiter((p["y"] for p in self.players.values()), np.float32, count=n)
+        pr = np.fromiter((self.START_RADIUS + p["score"] for p in self.players.values()),
+                         np.float32, count=n)
+        return px, py, pr
+
     def _create_balls(self, n):
         """Creates n new food balls in random locations."""
+        px_arr, py_arr, pr_arr = self._player_arrays()
+        new_ids, new_x, new_y, new_colors = [], [], [], []
         for _ in range(n):
-            while True:
-                is_safe_location = True
+            # Bounded rejection sampling: settle for the last candidate after
+            # MAX_SPAWN_TRIES so a crowded world can't stall the simulation.
+            for _try in range(self.MAX_SPAWN_TRIES):
                 x = random.randrange(0, self.W)
                 y = random.randrange(0, self.H)
                 # Ensure balls don't spawn on top of players
-                for player in self.players.values():
-                    dist = math.hypot(x - player["x"], y - player["y"])
-                    if dist <= self.START_RADIUS + player["score"]:
-                        is_safe_location = False
-                        break
-                if is_safe_location:
+                if _is_safe_spot(x, y, px_arr, py_arr, pr_arr):
                     break
-            self.balls.append((x, y, random.choice(self.COLORS)))
+            bid = self._next_ball_id
+            self._next_ball_id += 1
+            color = random.choice(self.COLORS)
+            new_ids.append(bid)
+            new_x.append(x)
+            new_y.append(y)
+            new_colors.append(color)
+            self._log_event("ball_add", bid, x, y, color)
+        base = self.ball_ids.size
+        self.ball_ids = np.concatenate([self.ball_ids, np.asarray(new_ids, np.uint32)])
+        self.bx = np.concatenate([self.bx, np.asarray(new_x, np.float32)])
+        self.by = np.concatenate([self.by, np.asarray(new_y, np.float32)])
+        self.bcolor = np.concatenate([self.bcolor, np.asarray(new_colors, np.uint8)])
+        for k, (x, y) in enumerate(zip(new_x, new_y)):
+            cell = (x // self.GRID_CELL, y // self.GRID_CELL)
+            self._ball_grid.setdefault(cell, []).append(base + k)
+        self._balls_changed = True
+
+    def _rebuild_ball_grid(self):
+        """Rebuilds the spatial hash; needed after removals shift array rows."""
+        grid = {}
+        cell_size = self.GRID_CELL
+        for row, (x, y) in enumerate(zip(self.bx, self.by)):
+            cell = (int(x) // cell_size, int(y) // cell_size)
+            grid.setdefault(cell, []).append(row)
+        self._ball_grid = grid
 
     def _get_start_location(self):
         """Finds a safe starting location for a new player."""
-        while True:
-            is_safe_location = True
+        px_arr, py_arr, pr_arr = self._player_arrays()
+        for _try in range(self.MAX_SPAWN_TRIES):
             x = random.randrange(0, self.W)
             y = random.randrange(0, self.H)
-            for player in self.players.values():
-                dist = math.hypot(x - player["x"], y - player["y"])
-                if dist <= self.START_RADIUS + player["score"]:
-                    is_safe_location = False
-                    break
-            if is_safe_location:
-                return (x, y)
+            if _is_safe_spot(x, y, px_arr, py_arr, pr_arr):
+                break
+        return (x, y)
 
     def _update_game_state(self):
         """Periodically updates game-wide state like the timer and mass loss."""
@@ -132,13 +258,30 @@ class GameServer:
         player = self.players[current_id]
         px, py, p_score = player["x"], player["y"], player["score"]
 
-        # 1. Player vs. Balls
-        for ball in self.balls[:]: # Iterate over a copy
-            bx, by, _ = ball
-            dist = math.hypot(px - bx, py - by)
-            if dist <= self.START_RADIUS + p_score:
-                player["score"] += 0.5
-                self.balls.remove(ball)
+        # 1. Player vs. Balls — gather candidates from the grid cells the
+        # player's radius overlaps, then run one vectorized distance test.
+        radius = self.START_RADIUS + p_score
+        cell_size = self.GRID_CELL
+        candidates = []
+        for cx in range(int(px - radius) // cell_size, int(px + radius) // cell_size + 1):
+            for cy in range(int(py - radius) // cell_size, int(py + radius) // cell_size + 1):
+                candidates.extend(self._ball_grid.get((cx, cy), ()))
+        if candidates:
+            rows = np.asarray(candidates, np.intp)
+            hit = _hit_mask(px, py, radius, self.bx[rows], self.by[rows])
+            if hit.any():
+                hit_rows = rows[hit]
+                player["score"] += 0.5 * len(hit_rows)
+                for bid in self.ball_ids[hit_rows]:
+                    self._log_event("ball_rem", int(bid))
+                keep = np.ones(self.ball_ids.size, bool)
+                keep[hit_rows] = False
+                self.ball_ids = self.ball_ids[keep]
+                self.bx = self.bx[keep]
+                self.by = self.by[keep]
+                self.bcolor = self.bcolor[keep]
+                self._rebuild_ball_grid()
+                self._balls_changed = True
 
         # 2. Player vs. Player
         for other_id, other_player in self.players.items():
@@ -146,10 +289,10 @@ class GameServer:
                 continue
 
             opx, opy, op_score = other_player["x"], other_player["y"], other_player["score"]
-            dist = math.hypot(px - opx, py - opy)
+            dx, dy = px - opx, py - opy
 
-            # Check if one player can eat the other
-            if p_score > op_score * 1.15 and dist < self.START_RADIUS + p_score:
+            # Check if one player can eat the other (squared distances, no sqrt)
+            if p_score > op_score * 1.15 and dx * dx + dy * dy < radius * radius:
                 player["score"] = math.sqrt(p_score**2 + op_score**2)
                 other_player["score"] = 0
                 other_player["x"], other_player["y"] = self._get_start_location()
@@ -160,71 +303,151 @@ class GameServer:
         self.msg_history.append(message)
         if len(self.msg_history) > 20:
             self.msg_history.pop(0)
+        self._log_event("msg", message)
+
+    def _log_event(self, *event):
+        """Records a world mutation for the per-client delta updates."""
+        self.events.append(event)
+        if len(self.events) > self.EVENT_LOG_CAP:
+            drop = len(self.events) - self.EVENT_LOG_CAP
+            del self.events[:drop]
+            self.event_base += drop
+
+    def _apply_input(self, item):
+        """Applies one queued client input; runs on the simulation thread."""
+        kind = item[0]
+        if kind == "join":
+            _, pid, username = item
+            self._add_chat_message(f"{username} CONNECTED")
+            start_pos = self._get_start_location()
+            color = self.COLORS[pid % len(self.COLORS)]
+            self.players[pid] = {
+                "x": start_pos[0], "y": start_pos[1],
+                "color": color, "score": 0, "name": username
+            }
+            self._log_event("player_add", pid, username, color)
+        elif kind == "move":
+            _, pid, x, y = item
+            player = self.players.get(pid)
+            if player:
+                player["x"], player["y"] = x, y
+        elif kind == "msg":
+            _, pid, text = item
+            player = self.players.get(pid)
+            if player:
+                self._add_chat_message(f"{player['name']}: {text}")
+        elif kind == "leave":
+            player = self.players.pop(item[1], None)
+            if player:
+                print(f"[DISCONNECT] {player['name']} has disconnected.")
+                self._add_chat_message(f"{player['name']} DISCONNECTED")
+                self._log_event("player_rem", item[1])
+
+    def _sim_loop(self):
+        """Fixed-rate simulation step: the only thread that mutates game state.
+
+        Drains queued client inputs, advances the world, then publishes one
+        immutable snapshot tuple that client threads read without locking.
+        """
+        tick = 1.0 / self.TICK_RATE
+        while True:
+            step_start = time.time()
+
+            while True:
+                try:
+                    self._apply_input(self._input_q.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._update_game_state()
+            if self.game_started:
+                for pid in list(self.players):
+                    if pid in self.players:  # an earlier eat may respawn but never removes
+                        self._check_collisions(pid)
+            if self.ball_ids.size < 150:
+                self._create_balls(random.randrange(50, 100))
+
+            # Re-pack the snapshot ball blob only on ticks where balls changed.
+            if self._balls_changed:
+                self._balls_blob = _pack_balls(self.ball_ids, self.bx, self.by, self.bcolor)
+                self._balls_changed = False
+
+            positions = {pid: (p["x"], p["y"], p["score"])
+                         for pid, p in self.players.items()}
+            players_full = {pid: dict(p) for pid, p in self.players.items()}
+            self._snapshot = (self.event_base, tuple(self.events), positions,
+                              self.game_time, self._balls_blob, players_full,
+                              tuple(self.msg_history))
+
+            time.sleep(max(0.0, tick - (time.time() - step_start)))
 
     def _handle_client(self, client_socket, current_id):
         """Handles all communication with a single client."""
         try:
             # 1. Initial Handshake
-            username = client_socket.recv(1024).decode("utf-8")
+            raw_username = _recv_msg(client_socket)
+            if raw_username is None:
+                raise ConnectionResetError("client closed during handshake")
+            username = raw_username.decode("utf-8")
             print(f"[LOG] {username} has connected with ID {current_id}.")
-            
-            with self.lock:
-                self._add_chat_message(f"{username} CONNECTED")
-                start_pos = self._get_start_location()
-                color = self.COLORS[current_id % len(self.COLORS)]
-                self.players[current_id] = {
-                    "x": start_pos[0], "y": start_pos[1],
-                    "color": color, "score": 0, "name": username
-                }
-
-            # WARNING: Using pickle is a security risk. A malicious client could
-            # send crafted data to execute code on your server.
-            # For a simple project it's okay, but for production, use JSON or a safer protocol.
-            client_socket.send(pickle.dumps(current_id))
+
+            self._input_q.put(("join", current_id, username))
+
+            # The id is a bare uint32 — no serializer needed on this path.
+            client_socket.sendall(struct.pack("<I", current_id))
+
+            # Replies are msgpack: plain data only, so nothing executable
+            # crosses the wire the way a crafted pickle could.
+            packer = msgpack.Packer(use_bin_type=True)
+
+            # Wait for the simulation tick that spawns the player, so the
+            # first snapshot this client receives already includes it.
+            while current_id not in self._snapshot[2]:
+                time.sleep(0.005)
+
+            # Sequence number of the next event this client has yet to see;
+            # None until it has received its first full snapshot.
+            client_seq = None
 
             # 2. Main Communication Loop
             while True:
-                data = client_socket.recv(self.BUFFER_SIZE)
-                if not data:
+                data = _recv_msg(client_socket)
+                if data is None:
                     break
-                
-                # The received data is a command string, e.g., "move 100 200"
-                command = pickle.loads(data)
-                
-                send_data = None
-                with self.lock:
-                    self._update_game_state()
-
-                    if command.startswith("move"):
-                        _, x, y = command.split()
-                        self.players[current_id]["x"] = int(x)
-                        self.players[current_id]["y"] = int(y)
-                        
-                        if self.game_started:
-                            self._check_collisions(current_id)
-                        
-                        if len(self.balls) < 150:
-                            self._create_balls(random.randrange(50, 100))
-                            
-                    elif command.startswith("msg"):
-                        msg = f"{self.players[current_id]['name']}: {command[4:]}"
-                        self._add_chat_message(msg)
-
-                    # Always package the full game state to send back
-                    send_data = (self.balls, self.players, self.game_time, self.msg_history)
-                
-                client_socket.send(pickle.dumps(send_data))
-
-        except (socket.error, ConnectionResetError, EOFError, pickle.UnpicklingError) as e:
+
+                # Commands are a one-byte tag plus a fixed struct payload
+                # (moves) or raw UTF-8 (chat) — no parser on the hot path.
+                tag = data[:1]
+                if tag == b"M":
+                    qx, qy = _MOVE_STRUCT.unpack(data[1:])
+                    self._input_q.put(("move", current_id, qx / 256, qy / 256))
+                elif tag == b"C":
+                    self._input_q.put(("msg", current_id, data[1:].decode("utf-8")))
+
+                # One atomic read of the latest published snapshot; reply with
+                # only what changed since this client's last tick, falling back
+                # to a full snapshot on first contact or after lagging past
+                # the event log.
+                (log_base, events, positions, game_time,
+                 balls_blob, players_full, msg_history) = self._snapshot
+                if client_seq is None or client_seq < log_base:
+                    payload = packer.pack(
+                        ("full", balls_blob, players_full, game_time,
+                         list(msg_history)))
+                else:
+                    payload = packer.pack(
+                        ("delta", events[client_seq - log_base:],
+                         positions, game_time))
+                client_seq = log_base + len(events)
+
+                _send_msg(client_socket, payload)
+
+        except (socket.error, ConnectionResetError, EOFError, struct.error,
+                UnicodeDecodeError) as e:
             print(f"[ERROR] Client {current_id} error: {e}")
         finally:
-            # 3. Cleanup on Disconnect
-            with self.lock:
-                if current_id in self.players:
-                    username = self.players[current_id]["name"]
-                    print(f"[DISCONNECT] {username} has disconnected.")
-                    self._add_chat_message(f"{username} DISCONNECTED")
-                    del self.players[current_id]
+            # 3. Cleanup on Disconnect — handled by the simulation thread
+            self._input_q.put(("leave", current_id))
             client_socket.close()
 
 if __name__ == "__main__":